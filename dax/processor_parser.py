@@ -1,9 +1,9 @@
 
-import copy
+import functools
 import itertools
 import logging
 import sys
-from collections import namedtuple
+from typing import Any, NamedTuple
 
 from .task import NeedInputsException
 from .task import NEED_INPUTS, OPEN_STATUS_LIST, BAD_QA_STATUS,\
@@ -13,6 +13,10 @@ from . import utilities
 
 LOGGER = logging.getLogger('dax')
 
+# the expressions come from a small, fixed set of processor yamls, so each one
+# only needs compiling once
+_extract_exp = functools.lru_cache(maxsize=256)(utilities.extract_exp)
+
 select_namespace = {
     'foreach': {'args': [{'optional': True, 'type': str}]},
     'one': {'args': []},
@@ -56,6 +60,9 @@ uri_paths = {
     'scan': '{0}/data{1}/resources/{2}'
 }
 
+# marks lazily loaded values that have not been loaded yet
+_NOT_LOADED = object()
+
 
 # parser pipeline
 # . check whether artefacts of the appropriate type are present for a given
@@ -76,19 +83,40 @@ uri_paths = {
 # were only used within scope of parse_session function
 
 class ParserArtefact:
-    def __init__(self, path, resources, entity):
+    __slots__ = ('name', 'path', 'resources_', 'entity', 'inputs_')
+
+    def __init__(self, path, entity):
         self.name = path.split('/')[-1]
         self.path = path
-        self.resources = resources,
+        self.resources_ = _NOT_LOADED
         self.entity = entity
+        self.inputs_ = _NOT_LOADED
+
+    @property
+    def resources(self):
+        # the parser itself never reads the resources, so they are only
+        # mapped by label when asked for
+        if self.resources_ is _NOT_LOADED:
+            self.resources_ = {
+                cres.label(): cres for cres in self.entity.resources()}
+        return self.resources_
+
+    def get_inputs(self):
+        # the entity decodes its inputs field on every call, so only do it
+        # once per artefact
+        if self.inputs_ is _NOT_LOADED:
+            self.inputs_ = self.entity.get_inputs()
+        return self.inputs_
 
     def __repr__(self):
         return '{}(path = {}, resources = {}, entity = {})'.format(
-            self.__class__.__name__, self.path, self.resources, self.entity
+            self.__class__.__name__, self.path, self.resources_, self.entity
         )
 
 
 class SelectSessionParameters:
+    __slots__ = ('mode', 'delta')
+
     def __init__(self, mode, delta):
         self.mode = mode
         self.delta = delta
@@ -99,9 +127,60 @@ class SelectSessionParameters:
                                                   self.delta)
 
 
-TimestampSession = namedtuple('TimestampSession', 'timestamp, session')
+class TimestampSession(NamedTuple):
+    timestamp: str
+    session: Any
+
+
+class ArtefactEntry(NamedTuple):
+    path: str
+    type: str
+    object: Any
+
+
+class ParameterMatrix(NamedTuple):
+    """
+    Combinations of inputs, stored as a tuple of value tuples per row with a
+    single shared set of headers, rather than as a dictionary per row.
+    The rows are None when no combinations can be generated because inputs
+    are missing, as opposed to a matrix without headers, which has a single
+    empty row when no input is iterated over
+    """
+    headers: tuple
+    rows: Any
+    header_index: dict
 
-ArtefactEntry = namedtuple('ArtefactEntry', 'path, type, object')
+    @classmethod
+    def from_rows(cls, headers, rows):
+        return cls(headers, rows, {h: i for i, h in enumerate(headers)})
+
+    @classmethod
+    def missing_inputs(cls):
+        return cls((), None, {})
+
+
+def _has_wildcards(expression):
+    """
+    Check whether a type expression uses any glob wildcards
+    :param expression: type expression from the processor yaml
+    :return: True if the expression is a pattern rather than a literal type
+    """
+    return any(c in expression for c in '*?[')
+
+
+def _hashable(value):
+    """
+    Convert an inputs value to an equivalent hashable value, so that sets of
+    inputs can be used as dictionary keys
+    :param value: inputs dictionary, or a value of one
+    :return: value with lists converted to tuples and dictionaries to
+    frozensets of their items
+    """
+    if isinstance(value, dict):
+        return frozenset((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
 
 
 class ProcessorParser:
@@ -131,6 +210,11 @@ class ProcessorParser:
 
         self.is_longitudinal_ = ProcessorParser.is_longitudinal(yaml_source)
 
+        # artefact statuses looked up by find_inputs, keyed by artefact path,
+        # and the sessions they were read from (see _get_status_cache)
+        self._status_cache = {}
+        self._status_sessions = []
+
     def parse_session(self, csess, sessions, pets=[]):
         """
         Parse a session to determine whether new assessors should be created.
@@ -140,10 +224,13 @@ class ProcessorParser:
         subject
         :return: None
         """
-        for i in range(len(sessions) - 1):
-            if sessions[i].creation_timestamp() <\
-                  sessions[i+1].creation_timestamp():
-                raise ValueError("session param is not ordered by datetime")
+        # statuses are only cached for the assessors of this session
+        self._status_cache = {}
+        self._status_sessions = []
+
+        if not all(a.creation_timestamp() >= b.creation_timestamp()
+                   for a, b in zip(sessions, sessions[1:])):
+            raise ValueError("session param is not ordered by datetime")
 
         if not self.is_longitudinal_:
             relevant_sessions = [csess]
@@ -245,7 +332,7 @@ class ProcessorParser:
 
         # map from parameters to input resources
         command_set = dict()
-        for k, v in list(self.variables_to_inputs.items()):
+        for k, v in self.variables_to_inputs.items():
             inp = self.inputs[v['input']]
             artefact_type = inp['artefact_type']
             resource = v['resource']
@@ -263,7 +350,7 @@ class ProcessorParser:
 
         # Check artefact status
         LOGGER.debug('checking status of each artefact')
-        for artk, artv in list(assr_inputs.items()):
+        for artk, artv in assr_inputs.items():
             LOGGER.debug('checking status:' + artk)
             inp = self.inputs[artk]
             art_type = inp['artefact_type']
@@ -274,13 +361,13 @@ class ProcessorParser:
             if art_type == 'scan':
                 # Check status of each input scan
                 for vinput in artv:
-                    qstatus = XnatUtils.get_scan_status(sessions, vinput)
+                    qstatus = self._get_scan_status(sessions, vinput)
                     if qstatus.lower() == 'unusable':
                         raise NeedInputsException(artk + ': Not Usable')
             else:
                 # Check status of each input assr
                 for vinput in artv:
-                    pstatus, qstatus = XnatUtils.get_assr_status(sessions, vinput)
+                    pstatus, qstatus = self._get_assr_status(sessions, vinput)
                     if pstatus in OPEN_STATUS_LIST + [NEED_INPUTS]:
                         raise NeedInputsException(artk + ': Not Ready')
 
@@ -297,47 +384,39 @@ class ProcessorParser:
                         if badstatus.lower() in qstatus.split(' ')[0].lower():
                             raise NeedInputsException(artk + ': Bad QC')
 
+        # file lists of the input resources, so that a resource used by
+        # several inputs is only listed once
+        resource_files = {}
+
         # Map from parameters to input resources
         LOGGER.debug('mapping params to artefact resources')
-        for k, v in list(self.variables_to_inputs.items()):
+        for k, v in self.variables_to_inputs.items():
             LOGGER.debug('mapping:' + k)
             inp = self.inputs[v['input']]
             artefact_type = inp['artefact_type']
             resource = v['resource']
 
-            # Find the resource
-            cur_res = None
-            for inp_res in inp['resources']:
-                if inp_res['varname'] == k:
-                    cur_res = inp_res
-                    break
+            cur_res = v['res_spec']
+            regex = cur_res['_fmatch_re']
 
-            # TODO: optimize this to get resource list only once
             for vnum, vinput in enumerate(assr_inputs[v['input']]):
-                robj = assr._intf.select(
-                    resource_paths[artefact_type].format(
-                        vinput, resource))
-
                 # Get list of all files in the resource, relative paths
-                file_list = [x._urn for x in robj.files().get('path')]
+                res_uri = resource_paths[artefact_type].format(
+                    vinput, resource)
+                if res_uri not in resource_files:
+                    resource_files[res_uri] = [
+                        x._urn for x in
+                        assr._intf.select(res_uri).files().get('path')]
+                file_list = resource_files[res_uri]
                 if len(file_list) == 0:
                     LOGGER.debug('empty or missing resource')
                     raise NeedInputsException('No Resource')
 
-                if 'fmatch' in cur_res:
-                    fmatch = cur_res['fmatch']
-                elif cur_res['ftype'] == 'FILE':
-                    # Default to all
-                    fmatch = '*'
-                else:
-                    fmatch = None
-
                 if 'filepath' in cur_res:
                     fpath = cur_res['filepath']
                     res_path = resource + '/files/' + fpath
-                elif fmatch:
+                elif regex is not None:
                     # Filter list based on regex matching
-                    regex = utilities.extract_exp(fmatch, full_regex=False)
                     file_list = [x for x in file_list if regex.match(x)]
 
                     if len(file_list) == 0:
@@ -386,6 +465,41 @@ class ProcessorParser:
 
         return variable_set, input_list
 
+    def _get_status_cache(self, sessions):
+        """
+        Get the cache of artefact statuses read from the given sessions.
+        The statuses are read from the cached session XML, so they are shared
+        between the find_inputs calls for the assessors of a session, but
+        only while the same session objects are passed in and none of them
+        have been reloaded, e.g. by the csess.refresh() calls the launcher
+        makes between building tasks. Otherwise the cache is emptied so that
+        statuses that changed upstream are picked up. parse_session also
+        empties it.
+        :param sessions: list of CachedImageSession the statuses are read from
+        :return: dictionary of ('scan'/'assessor', path) to status
+        """
+        state = [(s, getattr(s, 'cached_timestamp', None)) for s in sessions]
+        if len(state) != len(self._status_sessions) or\
+                any(s is not cs or t != ct for (s, t), (cs, ct)
+                    in zip(state, self._status_sessions)):
+            self._status_cache = {}
+            self._status_sessions = state
+        return self._status_cache
+
+    def _get_scan_status(self, sessions, scan_path):
+        status_cache = self._get_status_cache(sessions)
+        key = ('scan', scan_path)
+        if key not in status_cache:
+            status_cache[key] = XnatUtils.get_scan_status(sessions, scan_path)
+        return status_cache[key]
+
+    def _get_assr_status(self, sessions, assr_path):
+        status_cache = self._get_status_cache(sessions)
+        key = ('assessor', assr_path)
+        if key not in status_cache:
+            status_cache[key] = XnatUtils.get_assr_status(sessions, assr_path)
+        return status_cache[key]
+
     @staticmethod
     def _get_yaml_checker(version):
         if version == '1':
@@ -544,6 +658,19 @@ class ProcessorParser:
         # return candidates[0][0]
         return artefact['name']
 
+    @staticmethod
+    def _fmatch_regex(resource):
+        # compiled regex used to select the files of a resource, if any
+        if 'fmatch' in resource:
+            # an empty or null fmatch means the whole resource is used
+            if not resource['fmatch']:
+                return None
+            return _extract_exp(resource['fmatch'], full_regex=False)
+        elif resource.get('ftype') == 'FILE':
+            # Default to all
+            return _extract_exp('*', full_regex=False)
+        return None
+
     @staticmethod
     def parse_inputs(yaml_source):
         # TODO: BenM/assessor_of_assessor/check error conditions on inputs:
@@ -588,6 +715,7 @@ class ProcessorParser:
             artefact_required = False
             for r in resources:
                 r['required'] = r.get('required', True)
+                r['_fmatch_re'] = ProcessorParser._fmatch_regex(r)
                 artefact_required = artefact_required or r['required']
 
             inputs[name] = {
@@ -626,6 +754,7 @@ class ProcessorParser:
             artefact_required = False
             for r in resources:
                 r['required'] = r.get('required', True)
+                r['_fmatch_re'] = ProcessorParser._fmatch_regex(r)
             artefact_required = artefact_required or r['required']
 
             inputs[name] = {
@@ -656,6 +785,8 @@ class ProcessorParser:
                 iteration_map)
             types = [x.strip() for x in p['scantypes'].split(',')]
             tracer = [x.strip() for x in p['tracer'].split(',')]
+            for r in p.get('resources', []):
+                r['_fmatch_re'] = ProcessorParser._fmatch_regex(r)
             inputs[name] = {
                 'types': types,
                 'select': parsed_select,
@@ -703,26 +834,35 @@ class ProcessorParser:
     @staticmethod
     def parse_variables(inputs):
         variables_to_inputs = {}
-        for ik, iv in list(inputs.items()):
+        for ik, iv in inputs.items():
             for r in iv['resources']:
                 v = r.get('varname', '')
                 if v is not None and len(v) > 0:
-                    variables_to_inputs[v] =\
-                        {'input': ik, 'resource': r['resource']}
+                    variables_to_inputs[v] = {
+                        'input': ik,
+                        'resource': r['resource'],
+                        'res_spec': r
+                    }
 
         return variables_to_inputs
 
     @staticmethod
     def parse_artefacts(csesses, pets=[]):
+        """
+        Map the path of every scan and assessor of the sessions (and every pet
+        scan) to a ParserArtefact.
+        This only reads the cached session XML and makes no calls to XNAT, so
+        the sessions are parsed serially.
+        :param csesses: list of CachedImageSession to parse
+        :param pets: list of CachedImageSession for the pet sessions
+        :return: dictionary of artefact path to ParserArtefact
+        """
         def parse(carts, arts):
             for cart in carts:
-                resources = {}
-                for cres in cart.resources():
-                    resources[cres.label()] = cres
-                full_path = cart.full_path()
-                arts[full_path] = ParserArtefact(full_path,
-                                                 resources,
-                                                 cart)
+                # artefact paths are used as keys and matrix values throughout
+                # the parser, so share a single copy of each
+                full_path = sys.intern(cart.full_path())
+                arts[full_path] = ParserArtefact(full_path, cart)
 
         artefacts = {}
         for csess in csesses:
@@ -746,7 +886,22 @@ class ProcessorParser:
 
         artefacts_by_input = {k: [] for k in inputs}
 
-        for i, iv in list(inputs.items()):
+        # compile the type expressions once per input rather than once per
+        # scan, and keep the literal types aside so they can be matched with
+        # a simple lookup
+        compiled_types = {}
+        literal_types = {}
+        for i, iv in inputs.items():
+            compiled_types[i] = [_extract_exp(e) for e in iv['types']
+                                 if _has_wildcards(e)]
+            literal_types[i] = set(e for e in iv['types']
+                                   if not _has_wildcards(e))
+
+        def type_matches(i, stype):
+            return stype in literal_types[i] or\
+                any(regex.match(stype) for regex in compiled_types[i])
+
+        for i, iv in inputs.items():
             # BDB 6/5/21 
             # here we do something to filter the list of sessions based
             # on the select types in the inputs???
@@ -769,52 +924,46 @@ class ProcessorParser:
                 continue
 
             if 'tracer' in iv:
+                tracer_regexes = [
+                    _extract_exp(e) for e in iv['tracer']]
+
                 # The input is a petscan so look in the pets
                 for p in pets:
                     # Match the tracer name
                     tracer_name = p.get('xnat:tracer/name')
-                    tracer_match = False
-                    for expression in iv['tracer']:
-                        regex = utilities.extract_exp(expression)
-                        if regex.match(tracer_name):
-                            # found a match so exit the loop
-                            tracer_match = True
-                            break
-
-                    if not tracer_match:
+                    if not any(r.match(tracer_name) for r in tracer_regexes):
                         # None of the expressions matched
                         LOGGER.debug('tracer no matchy:{}:{}'.format(
                             tracer_name, iv['tracer']))
                         continue
-                    
+
                     # Now try to match the scan type
                     for pscan in p.scans():
-                        for expression in iv['types']:
-                            regex = utilities.extract_exp(expression)
-                            if regex.match(pscan.type()):
-                                # Found a match, now check quality
-                                if pscan.info().get('quality') == 'unusable':
-                                    LOGGER.info('excluding unusable scan')
-                                else:
-                                    artefacts_by_input[i].append(pscan.full_path())
+                        if type_matches(i, pscan.type()):
+                            # Found a match, now check quality
+                            if pscan.info().get('quality') == 'unusable':
+                                LOGGER.info('excluding unusable scan')
+                            else:
+                                artefacts_by_input[i].append(
+                                    sys.intern(pscan.full_path()))
 
             else:
+                select_all = iv.get('select')[0] == 'all'
+
                 # Iterate each scan on the session
                 for cscan in csess.scans():
-                    for expression in iv['types']:
-                        regex = utilities.extract_exp(expression)
-                        if regex.match(cscan.type()):
-                            if iv.get('select')[0] == 'all' and\
-                                 cscan.info().get('quality') == 'unusable':
-                                LOGGER.info('excluding unusable scan')
-                            else:
-                                artefacts_by_input[i].append(cscan.full_path())
-                            # Break here so we don't match multiple times
-                            break
+                    if type_matches(i, cscan.type()):
+                        if select_all and\
+                             cscan.info().get('quality') == 'unusable':
+                            LOGGER.info('excluding unusable scan')
+                        else:
+                            artefacts_by_input[i].append(
+                                sys.intern(cscan.full_path()))
 
                 for cassr in csess.assessors():
                     if cassr.type() in iv['types']:
-                        artefacts_by_input[i].append(cassr.full_path())
+                        artefacts_by_input[i].append(
+                            sys.intern(cassr.full_path()))
 
         return artefacts_by_input
 
@@ -830,30 +979,29 @@ class ProcessorParser:
         all_inputs = []
         input_dimension_map = []
 
-        # check whether all inputs are present
-        for i, iv in list(inputs.items()):
-            if len(artefacts_by_input[i]) == 0 and iv['required'] is True:
-                return []
-
-        # add in None for optional inputs so that the matrix can be generated
-        # without artefacts present for those inputs
+        # check whether all inputs are present, adding in None for optional
+        # inputs so that the matrix can be generated without artefacts
+        # present for those inputs
         sanitised_inputs = {}
-        for i, iv in list(inputs.items()):
+        for i, iv in inputs.items():
             if len(artefacts_by_input[i]) == 0:
-                sanitised_inputs[i] = [list().append(None)]
+                if iv['required'] is True:
+                    return ParameterMatrix.missing_inputs()
+                sanitised_inputs[i] = [None]
             else:
                 sanitised_inputs[i] = artefacts_by_input[i]
 
         for i in iteration_sources:
-            # find other inputs that map to this iteration source
-            mapped_inputs = [i]
+            # find other inputs that map to this iteration source, keeping
+            # their names and their artefact vectors in parallel lists
+            vec_names = [i]
             select_fn = inputs[i]['select'][0]
 
             # first, check iteration source and get the appropriate list of
             # artefacts
             cur_input_vector = None
             if select_fn == 'foreach':
-                cur_input_vector = sanitised_inputs[i][:]
+                cur_input_vector = sanitised_inputs[i]
 
             elif select_fn == 'all':
                 cur_input_vector = [[sanitised_inputs[i][:]]]
@@ -869,105 +1017,105 @@ class ProcessorParser:
             if select_fn in ['foreach', 'from']:
                 # build up the set of mapped input vectors one by one based on
                 # the select mode of the mapped input
-                combined_input_vector = [cur_input_vector]
-                for k, v in list(iteration_map.items()):
+                vec_values = [cur_input_vector]
+                for k, v in iteration_map.items():
                     if inputs[k]['select'][0] == 'foreach':
                         (v1, v2) = v, None
                     else:
                         (v1, v2) = v.split('/')
                     if v1 == i:
-                        mapped_inputs.append(k)
+                        vec_names.append(k)
                         if inputs[k]['select'][0] == 'foreach':
-                            combined_input_vector.append(
-                                sanitised_inputs[k][:])
+                            vec_values.append(sanitised_inputs[k])
                         else:  # from
                             from_artefacts = sanitised_inputs[v1]
                             mapped_input_vector = []
                             for fa in from_artefacts:
-                                a = artefacts[fa]
-                                from_inputs = a.entity.get_inputs()
+                                from_inputs = artefacts[fa].get_inputs()
                                 if from_inputs is not None:
                                     mapped_input_vector.append(
                                         from_inputs[v2])
 
-                            combined_input_vector.append(mapped_input_vector)
+                            vec_values.append(mapped_input_vector)
 
                     else:
                         pass
 
-                # 'trim' the input vectors to the number of entries of the
-                # shortest vector. We don't actually truncate the datasets but
-                # just use the number when transposing, below
-                min_entry_count = min((len(e) for e in combined_input_vector))
+                if not all(vec_values):
+                    # a mapped input has no values, e.g. none of the 'from'
+                    # artefacts have inputs, so there are no combinations
+                    # and the remaining iteration sources can be skipped
+                    return ParameterMatrix.missing_inputs()
 
                 # transpose from list of input vectors to input entry lists,
-                # one per combination of inputs
-                merged_input_vector = [
-                    [None for col in range(len(combined_input_vector))]
-                    for row in range(min_entry_count)]
-                for row in range(min_entry_count):
-                    for col in range(len(combined_input_vector)):
-                        merged_input_vector[row][col] =\
-                            combined_input_vector[col][row]
-
-                all_inputs.append(mapped_inputs)
+                # one per combination of inputs. zip stops at the shortest
+                # vector, which 'trims' the vectors to the same length
+                merged_input_vector = [list(t) for t in zip(*vec_values)]
+
+                all_inputs.append(vec_names)
                 input_dimension_map.append(merged_input_vector)
 
             else:
-                all_inputs.append(mapped_inputs)
+                all_inputs.append(vec_names)
                 input_dimension_map.append(cur_input_vector)
 
-        # perform a cartesian product of the dimension map entries to get the
-        # final input combinations
-        matrix = [list(
-            itertools.chain.from_iterable(x)) for x in itertools.product(
-                *input_dimension_map)]
-
-        matrix_headers = list(itertools.chain.from_iterable(all_inputs))
+        matrix_headers = tuple(itertools.chain.from_iterable(all_inputs))
 
-        # rebuild the matrix to order the inputs consistently
-        final_matrix = []
-        for r in matrix:
-            row = dict()
-            for i in range(len(matrix_headers)):
-                row[matrix_headers[i]] = r[i]
-            final_matrix.append(row)
+        # lazily perform a cartesian product of the dimension map entries to
+        # get the final input combinations, as tuples of values in the same
+        # order as the headers
+        rows = (tuple(itertools.chain.from_iterable(x))
+                for x in itertools.product(*input_dimension_map))
 
-        return final_matrix
+        return ParameterMatrix.from_rows(matrix_headers, rows)
 
     @staticmethod
     def compare_to_existing(csesses, proc_type, parameter_matrix):
 
         csess = csesses[0]
 
-        assessors = [[] for _ in range(len(parameter_matrix))]
+        headers = parameter_matrix.headers
 
+        # index the existing assessors by their inputs, in header order, so
+        # that each parameter set is matched with a lookup and the rows can
+        # be consumed as they are generated
+        existing = {}
         for casr in [a for a in csess.assessors() if a.type() == proc_type]:
             inputs = casr.get_inputs()
             if inputs is None:
                 LOGGER.warn('skipping, inputs field is empty:' + casr.label())
                 return list()
 
-            for pi, p in enumerate(parameter_matrix):
-                if inputs == p:
-                    # BDB 6/5/21 do we ever have more than one assessor
-                    # with the same set of inputs?
-                    assessors[pi].append(casr)
+            # only inputs with exactly the matrix inputs can match a row
+            if len(inputs) != len(headers) or\
+                    any(h not in inputs for h in headers):
+                continue
+
+            # BDB 6/5/21 do we ever have more than one assessor
+            # with the same set of inputs?
+            key = _hashable([inputs[h] for h in headers])
+            existing.setdefault(key, []).append(casr)
 
-        return list(zip(copy.deepcopy(parameter_matrix), assessors))
+        if parameter_matrix.rows is None:
+            # inputs are missing, so there are no parameter sets
+            return list()
+
+        # each row gets a dictionary and an assessor list of its own
+        return [(dict(zip(headers, r)), list(existing.get(_hashable(r), ())))
+                for r in parameter_matrix.rows]
 
     @staticmethod
-    def get_input_value(input_name, parameter, artefacts):
-        if '/' not in input_name:
+    def get_input_value(input_spec, parameter, artefacts):
+        _, _column, _child_name = input_spec
+        if _child_name is None:
             # Matching on parent so keep this value
-            _val = parameter[input_name]
+            _val = parameter[_column]
         else:
-            # Match is on a parent so parse out the parent/child
-            (_parent_name, _child_name) = input_name.split('/')
-            _parent_val = parameter[_parent_name]
+            # Match is on a parent so get the child from its inputs
+            _parent_val = parameter[_column]
             _parent_art = artefacts[_parent_val]
 
-            _parent_art_inputs = _parent_art.entity.get_inputs()
+            _parent_art_inputs = _parent_art.get_inputs()
             if _parent_art_inputs is None:
                 # Check that inputs field is not empty
                 LOGGER.warn('inputs field is empty:' + _parent_val)
@@ -979,26 +1127,78 @@ class ProcessorParser:
 
         return _val
 
+    @staticmethod
+    def parse_filter_input(input_name, header_index):
+        """
+        Resolve an input named in a match filter to the matrix column holding
+        it, or holding its parent when matching on a parent/child
+        :param input_name: filter input, either 'input' or 'parent/child'
+        :param header_index: map of matrix headers to their column
+        :return: tuple of input name, column and child name (None when not
+        matching on a parent); a plain tuple as it is unpacked per param set
+        """
+        if '/' not in input_name:
+            return input_name, header_index[input_name], None
+
+        (_parent_name, _child_name) = input_name.split('/')
+        return input_name, header_index[_parent_name], _child_name
+
     @staticmethod
     def filter_matrix(parameter_matrix, match_filters, artefacts):
-        filtered_matrix = []
-        for cur_param in parameter_matrix:
+        if parameter_matrix.rows is None:
+            # inputs are missing, so there is nothing to filter
+            return parameter_matrix
+
+        header_index = parameter_matrix.header_index
+
+        # resolve the filter input names to matrix columns once, rather than
+        # splitting and looking them up for every param set
+        parsed_filters = [
+            [ProcessorParser.parse_filter_input(n, header_index) for n in f]
+            for f in match_filters]
+
+        # a parent/child value only depends on the parent artefact, so it is
+        # looked up once per artefact rather than once per combination
+        resolved_values = {}
+
+        def input_value(input_spec, cur_param):
+            _, column, child = input_spec
+            if child is None:
+                return cur_param[column]
+
+            key = (child, cur_param[column])
+            if key not in resolved_values:
+                resolved_values[key] = ProcessorParser.get_input_value(
+                    input_spec, cur_param, artefacts)
+            return resolved_values[key]
+
+        return parameter_matrix._replace(
+            rows=ProcessorParser._filter_rows(
+                parameter_matrix.rows, parsed_filters, input_value))
+
+    @staticmethod
+    def _filter_rows(rows, match_filters, input_value):
+        # split each filter into the input that the others are compared with
+        # and the others, once rather than for every param set
+        split_filters = [(f[0], f[1:]) for f in match_filters]
+
+        # filter the combinations as they are generated so that rejected
+        # combinations are never collected
+        for cur_param in rows:
             # Reset matching for this param set
             all_match = True
 
-            for cur_filter in match_filters:
+            for first_input, other_inputs in split_filters:
                 # Get the first value to compare with others
-                first_val = ProcessorParser.get_input_value(
-                    cur_filter[0], cur_param, artefacts)
+                first_val = input_value(first_input, cur_param)
 
                 # Compare other values with first value
-                for cur_input in cur_filter[1:]:
-                    cur_val = ProcessorParser.get_input_value(
-                        cur_input, cur_param, artefacts)
+                for cur_input in other_inputs:
+                    cur_val = input_value(cur_input, cur_param)
 
                     if cur_val is None:
                         LOGGER.warn('cannot match, empty inputs:{}'.format(
-                            cur_input))
+                            cur_input[0]))
                         all_match = False
                         break
 
@@ -1007,8 +1207,10 @@ class ProcessorParser:
                         all_match = False
                         break
 
+                if not all_match:
+                    # No need to check the remaining filters
+                    break
+
             if all_match:
                 # Keep this param set if everything matches
-                filtered_matrix.append(cur_param)
-
-        return filtered_matrix
+                yield cur_param
@@ -1,4 +1,4 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 
 import copy
 
@@ -6,8 +6,10 @@ import io
 import yaml
 import itertools
 
-from dax.processor_parser import ProcessorParser
+from dax.processor_parser import ParameterMatrix, ParserArtefact,\
+    ProcessorParser, SelectSessionParameters
 from dax.processors import AutoProcessor
+from dax.task import NeedInputsException
 from dax.tests import unit_test_entity_common as common
 from dax.tests import unit_test_common_processor_yamls as yamls
 from dax import yaml_doc
@@ -128,6 +130,9 @@ class TestArtefact:
     def unusable(self):
         return self.quality() == 'unusable'
 
+    def info(self):
+        return {'quality': self.quality_}
+
     def resources(self):
         return self.resources_
 
@@ -190,6 +195,38 @@ class TestSession:
     def full_path(self):
         sess_path.format(self.proj, self.subj, self.sess)
 
+    def creation_timestamp(self):
+        return '2021-06-05 00:00:00'
+
+
+class TestInterface:
+
+    host = 'https://xnat.test'
+
+    class TestFile:
+        def __init__(self, urn):
+            self._urn = urn
+
+    class TestFiles:
+        def __init__(self, files):
+            self.files_ = files
+
+        def files(self):
+            return self
+
+        def get(self, name):
+            return [TestInterface.TestFile(f) for f in self.files_]
+
+    def __init__(self, files=None):
+        # resource uri to file names; other resources hold one image
+        self.files_ = files or {}
+        self.selected = []
+
+    def select(self, uri):
+        self.selected.append(uri)
+        return TestInterface.TestFiles(
+            self.files_.get(uri, ['image.nii.gz']))
+
 
 scan_files = [('SNAPSHOTS', 2), ('NIFTI', 1)]
 
@@ -787,6 +824,324 @@ class ProcessorParserUnitTests(TestCase):
                     raise
         print(('scenario count = ', len(matrix)))
 
+    def test_parse_artefacts(self):
+        scans = [(proj, subj, sess, '1', 'T1', 'usable', scan_files),
+                 (proj, subj, sess, '2', 'FLAIR', 'usable', [])]
+        asrs = [(proj, subj, sess, 'asr1', 'proc1', 'usable', asr_files,
+                 {'scan_t': scan_path.format(proj, subj, sess, '1')})]
+        csess = TestSession().OldInit(proj, subj, sess, scans, asrs)
+        pet = TestSession().OldInit(
+            proj, subj, 'pet1', [(proj, subj, 'pet1', '1', 'PET', 'usable',
+                                  [])], [])
+
+        artefacts = ProcessorParser.parse_artefacts([csess], [pet])
+
+        self.assertEqual(
+            sorted(artefacts),
+            sorted([scan_path.format(proj, subj, sess, '1'),
+                    scan_path.format(proj, subj, sess, '2'),
+                    assessor_path.format(proj, subj, sess, 'asr1'),
+                    scan_path.format(proj, subj, 'pet1', '1')]))
+
+        t1 = artefacts[scan_path.format(proj, subj, sess, '1')]
+        self.assertEqual(t1.name, '1')
+        self.assertIs(t1.entity, csess.scans()[0])
+        with mock.patch.object(t1.entity, 'resources') as resources:
+            repr(t1)
+            resources.assert_not_called()
+        self.assertEqual(sorted(t1.resources), ['NIFTI', 'SNAPSHOTS'])
+        self.assertIs(t1.resources['NIFTI'], csess.scans()[0].resources()[1])
+
+        asr1 = artefacts[assessor_path.format(proj, subj, sess, 'asr1')]
+        self.assertEqual(sorted(asr1.resources),
+                         sorted(a[0] for a in asr_files))
+        self.assertEqual(asr1.get_inputs(), asrs[0][7])
+
+    def test_find_inputs_empty_fmatch(self):
+        t1 = scan_path.format(proj, subj, sess, '1')
+        assr = mock.Mock(_intf=TestInterface())
+        csess = TestSession().OldInit(
+            proj, subj, sess,
+            [(proj, subj, sess, '1', 'T1', 'usable', scan_files)], [])
+
+        # an empty or null fmatch uses the whole resource
+        for fmatch in ['', None]:
+            yaml_source = {
+                'inputs': {'xnat': {'scans': [{
+                    'name': 'scan_t1', 'types': 'T1',
+                    'resources': [{'resource': 'NIFTI', 'varname': 't1',
+                                   'fdest': 't1.nii.gz', 'ftype': 'FILE',
+                                   'fmatch': fmatch}]}]}},
+                'attrs': {}}
+            parser = ProcessorParser(yaml_source, 'proc2')
+
+            _, input_list = parser.find_inputs(
+                assr, [csess], {'scan_t1': [t1]})
+            self.assertEqual(
+                input_list,
+                [{'fdest': 't1.nii.gz', 'ftype': 'FILE', 'ddest': '',
+                  'fpath': 'https://xnat.test/data{}/resources/NIFTI/files'
+                           .format(t1)}])
+
+    def test_find_inputs_resource_listing(self):
+        yaml_source = {
+            'inputs': {'xnat': {'scans': [
+                {'name': 'scan_t1', 'types': 'T1',
+                 'resources': [{'resource': 'NIFTI', 'varname': 't1',
+                                'fdest': 't1.nii.gz', 'ftype': 'FILE'}]},
+                {'name': 'scan_t1_seg', 'types': 'T1',
+                 'resources': [{'resource': 'NIFTI', 'varname': 'seg',
+                                'fdest': 'seg.nii.gz', 'ftype': 'FILE',
+                                'fmatch': '*.txt'}]},
+                {'name': 'scan_fl', 'types': 'FLAIR',
+                 'resources': [{'resource': 'NIFTI', 'varname': 'fl',
+                                'fdest': 'fl.nii.gz', 'ftype': 'FILE'}]}]}},
+            'attrs': {}}
+        parser = ProcessorParser(yaml_source, 'proc2')
+
+        t1 = scan_path.format(proj, subj, sess, '1')
+        fl = scan_path.format(proj, subj, sess, '2')
+        t1_res = t1 + '/resources/NIFTI'
+        fl_res = fl + '/resources/NIFTI'
+        csess = TestSession().OldInit(proj, subj, sess, [], [])
+
+        # a resource shared by several inputs is only listed once
+        intf = TestInterface({t1_res: ['t1.nii.gz', 'seg.txt']})
+        assr = mock.Mock(_intf=intf)
+        variable_set, _ = parser.find_inputs(
+            assr, [csess],
+            {'scan_t1': [t1], 'scan_t1_seg': [t1], 'scan_fl': [fl]})
+        self.assertEqual(variable_set, {'t1': 't1.nii.gz',
+                                        'seg': 'seg.nii.gz',
+                                        'fl': 'fl.nii.gz'})
+        self.assertEqual(intf.selected, [t1_res, fl_res])
+
+        # listing stops at the first resource that fails
+        for files, error in [([], 'No Resource'), (['t1.nii.gz'], 'No Files')]:
+            intf = TestInterface({t1_res: files})
+            assr = mock.Mock(_intf=intf)
+            with self.assertRaises(NeedInputsException) as context:
+                parser.find_inputs(
+                    assr, [csess],
+                    {'scan_t1': [t1], 'scan_t1_seg': [t1], 'scan_fl': [fl]})
+            self.assertEqual(context.exception.value, error)
+            self.assertEqual(intf.selected, [t1_res])
+
+    def test_find_inputs_status_cache(self):
+        yaml_source = {
+            'inputs': {'xnat': {
+                'scans': [{
+                    'name': 'scan_t1', 'types': 'T1', 'needs_qc': True,
+                    'resources': [{'resource': 'NIFTI', 'varname': 't1',
+                                   'fdest': 't1.nii.gz', 'ftype': 'FILE'}]}],
+                'assessors': [{
+                    'name': 'asr_seg', 'proctypes': 'proc1',
+                    'resources': [{'resource': 'SEG', 'varname': 'seg',
+                                   'fdest': 'seg.nii.gz', 'ftype': 'FILE'}]}]
+            }},
+            'attrs': {}}
+        parser = ProcessorParser(yaml_source, 'proc2')
+
+        t1 = scan_path.format(proj, subj, sess, '1')
+        seg = assessor_path.format(proj, subj, sess, 'asr1')
+        assr_inputs = {'scan_t1': [t1], 'asr_seg': [seg]}
+        assr = mock.Mock(_intf=TestInterface())
+        csess = TestSession().OldInit(
+            proj, subj, sess,
+            [(proj, subj, sess, '1', 'T1', 'usable', scan_files)],
+            [(proj, subj, sess, 'asr1', 'proc1', 'usable', asr_files, {})])
+        csess.cached_timestamp = 1
+
+        with mock.patch('dax.XnatUtils.get_scan_status',
+                        return_value='usable') as scan_status,\
+                mock.patch('dax.XnatUtils.get_assr_status',
+                           return_value=('COMPLETE', 'Passed')) as assr_status:
+            # statuses are looked up once per path across find_inputs calls
+            for _ in range(3):
+                variable_set, _ = parser.find_inputs(
+                    assr, [csess], assr_inputs)
+            self.assertEqual(variable_set,
+                             {'t1': 't1.nii.gz', 'seg': 'seg.nii.gz'})
+            scan_status.assert_called_once_with([csess], t1)
+            assr_status.assert_called_once_with([csess], seg)
+
+            # reloading the session drops the cached statuses
+            csess.cached_timestamp = 2
+            parser.find_inputs(assr, [csess], assr_inputs)
+            self.assertEqual(scan_status.call_count, 2)
+            self.assertEqual(assr_status.call_count, 2)
+
+            # as does passing other session objects
+            parser.find_inputs(assr, [copy.copy(csess)], assr_inputs)
+            self.assertEqual(scan_status.call_count, 3)
+
+            # and parsing a session
+            parser.parse_session(csess, [csess])
+            parser.find_inputs(assr, [csess], assr_inputs)
+            self.assertEqual(scan_status.call_count, 4)
+            self.assertEqual(assr_status.call_count, 4)
+
+    @staticmethod
+    def _select_input(types, select='foreach', **kwargs):
+        inp = {'types': types,
+               'select': [select],
+               'select-session': SelectSessionParameters('current', 0)}
+        inp.update(kwargs)
+        return inp
+
+    def test_map_artefacts_to_inputs_types(self):
+        scans = [(proj, subj, sess, label, stype, 'usable', [])
+                 for label, stype in [('1', 'T1'), ('2', 'T1w'),
+                                      ('3', 'FLAIR'), ('4', 'T2'),
+                                      ('5', 'T2_FLAIR'), ('6', 'xT1')]]
+        asrs = [(proj, subj, sess, 'asr1', 'proc1', 'usable', [], {})]
+        csess = TestSession().OldInit(proj, subj, sess, scans, asrs)
+        inputs = {
+            'literal': self._select_input(['T1']),
+            'glob': self._select_input(['T1*']),
+            'mixed': self._select_input(['FLAIR', 'T2*']),
+            'overlap': self._select_input(['T1', 'T1*', 'T?w']),
+            'asr': self._select_input(['proc1'])
+        }
+
+        result = ProcessorParser.map_artefacts_to_inputs(
+            [csess], inputs, [])
+
+        def scans_of(*labels):
+            return [scan_path.format(proj, subj, sess, x) for x in labels]
+
+        # each scan is added once, however many of the types it matches
+        self.assertEqual(result, {
+            'literal': scans_of('1'),
+            'glob': scans_of('1', '2'),
+            'mixed': scans_of('3', '4', '5'),
+            'overlap': scans_of('1', '2'),
+            'asr': [assessor_path.format(proj, subj, sess, 'asr1')]
+        })
+
+    def test_map_artefacts_to_inputs_pet_types(self):
+        class TestPetSession(TestSession):
+            def get(self, name):
+                return {'xnat:tracer/name': 'FDG'}[name]
+
+        pets = [TestPetSession().OldInit(
+            proj, subj, 'pet1',
+            [(proj, subj, 'pet1', label, stype, quality, [])
+             for label, stype, quality in [('1', 'PET_AC', 'usable'),
+                                           ('2', 'PET_NAC', 'usable'),
+                                           ('3', 'CT', 'usable'),
+                                           ('4', 'PET_AC', 'unusable')]],
+            [])]
+        csess = TestSession().OldInit(proj, subj, sess, [], [])
+        inputs = {
+            'pet': self._select_input(['PET_AC', 'PET*'], tracer=['FDG*']),
+            'pet_literal': self._select_input(['PET_NAC'], tracer=['FDG']),
+            'pet_other_tracer': self._select_input(['PET*'], tracer=['PIB'])
+        }
+
+        result = ProcessorParser.map_artefacts_to_inputs(
+            [csess], inputs, pets)
+
+        # a pet scan matching several of the types is only added once, and
+        # unusable pet scans are left out
+        self.assertEqual(result, {
+            'pet': [scan_path.format(proj, subj, 'pet1', '1'),
+                    scan_path.format(proj, subj, 'pet1', '2')],
+            'pet_literal': [scan_path.format(proj, subj, 'pet1', '2')],
+            'pet_other_tracer': []
+        })
+
+    def test_compare_to_existing(self):
+        t1_1 = scan_path.format(proj, subj, sess, '1')
+        t1_2 = scan_path.format(proj, subj, sess, '2')
+        fls = [scan_path.format(proj, subj, sess, '11'),
+               scan_path.format(proj, subj, sess, '12')]
+        headers = ('scan_t', 'scan_f')
+        rows = [(t1_1, fls), (t1_2, fls)]
+        asrs = [
+            (proj, subj, sess, 'asr1', 'proc2', 'usable', [],
+             {'scan_t': t1_2, 'scan_f': list(fls)}),
+            (proj, subj, sess, 'asr2', 'proc1', 'usable', [],
+             {'scan_t': t1_1, 'scan_f': list(fls)}),
+            (proj, subj, sess, 'asr3', 'proc2', 'usable', [],
+             {'scan_t': t1_1, 'scan_f': fls[:1]}),
+            (proj, subj, sess, 'asr4', 'proc2', 'usable', [],
+             {'scan_t': t1_1, 'scan_f': list(fls), 'scan_x': t1_2})
+        ]
+        csess = [TestSession().OldInit(proj, subj, sess, [], asrs)]
+
+        result = ProcessorParser.compare_to_existing(
+            csess, 'proc2', ParameterMatrix.from_rows(headers, iter(rows)))
+
+        expected = [({'scan_t': t1_1, 'scan_f': fls}, []),
+                    ({'scan_t': t1_2, 'scan_f': fls},
+                     [csess[0].assessors()[0]])]
+        self.assertEqual(result, expected)
+
+    def test_filter_matrix(self):
+        t1_1 = scan_path.format(proj, subj, sess, '1')
+        t1_2 = scan_path.format(proj, subj, sess, '2')
+        asr1 = assessor_path.format(proj, subj, sess, 'asr1')
+        asr2 = assessor_path.format(proj, subj, sess, 'asr2')
+        asr3 = assessor_path.format(proj, subj, sess, 'asr3')
+        csess = TestSession().OldInit(proj, subj, sess, [], [
+            (proj, subj, sess, 'asr1', 'proc1', 'usable', [],
+             {'scan_t1': t1_1}),
+            (proj, subj, sess, 'asr2', 'proc1', 'usable', [],
+             {'scan_t1': t1_2}),
+            (proj, subj, sess, 'asr3', 'proc1', 'usable', [], None)])
+        artefacts = {a.full_path(): ParserArtefact(a.full_path(), a)
+                     for a in csess.assessors()}
+
+        # direct match between two inputs
+        matrix = ParameterMatrix.from_rows(
+            ('scan_a', 'scan_b'),
+            itertools.product([t1_1, t1_2], [t1_1, t1_2]))
+        result = ProcessorParser.filter_matrix(
+            matrix, [['scan_a', 'scan_b']], artefacts)
+        self.assertEqual(result.headers, matrix.headers)
+        self.assertEqual(result.header_index, {'scan_a': 0, 'scan_b': 1})
+        self.assertEqual(list(result.rows), [(t1_1, t1_1), (t1_2, t1_2)])
+
+        # parent/child match, where the parent without inputs never matches
+        matrix = ParameterMatrix.from_rows(
+            ('scan_t1', 'asr_seg'),
+            itertools.product([t1_1, t1_2], [asr1, asr2, asr3]))
+        with self.assertLogs('dax', 'WARNING') as logs:
+            result = ProcessorParser.filter_matrix(
+                matrix, [['scan_t1', 'asr_seg/scan_t1']], artefacts)
+            self.assertEqual(list(result.rows),
+                             [(t1_1, asr1), (t1_2, asr2)])
+        # the parent's inputs are looked up once, not once per row
+        self.assertEqual(
+            logs.output,
+            ['WARNING:dax:inputs field is empty:' + asr3] +
+            ['WARNING:dax:cannot match, empty inputs:asr_seg/scan_t1'] * 2)
+
+        # a required input is missing, so there is nothing to filter
+        inputs = {'scan_t1': {'required': True, 'select': ['foreach']}}
+        matrix = ProcessorParser.generate_parameter_matrix(
+            inputs, ['scan_t1'], {}, artefacts, {'scan_t1': []})
+        self.assertEqual(matrix, ParameterMatrix.missing_inputs())
+        result = ProcessorParser.filter_matrix(
+            matrix, [['scan_t1', 'asr_seg/scan_t1']], artefacts)
+        self.assertIs(result, matrix)
+        self.assertEqual(
+            ProcessorParser.compare_to_existing([csess], 'proc1', result), [])
+
+        # no input is iterated over, so there is a single row without
+        # headers, which filters on unknown inputs cannot be applied to
+        matrix = ProcessorParser.generate_parameter_matrix(
+            inputs, [], {}, artefacts, {'scan_t1': [t1_1]})
+        self.assertEqual(matrix.headers, ())
+        result = ProcessorParser.filter_matrix(matrix, [], artefacts)
+        self.assertEqual(list(result.rows), [()])
+        matrix = ProcessorParser.generate_parameter_matrix(
+            inputs, [], {}, artefacts, {'scan_t1': [t1_1]})
+        with self.assertRaises(KeyError):
+            ProcessorParser.filter_matrix(
+                matrix, [['scan_t1', 'asr_seg/scan_t1']], artefacts)
+
     def test_check_valid_mode(self):
         input_category = 'scan'
         input_name = 'a_scan'